@@ -2,8 +2,8 @@
 
 import streamlit as st
 import streamlit.components.v1 as components
-import os
-from AdvancedVRP import run_vrp
+import time
+from AdvancedVRP import get_scheduler
 
 import pandas as pd
 import altair as alt
@@ -20,17 +20,44 @@ st.markdown(
 )
 st.write("This dashboard displays an optimized delivery map from the Last Mile Delivery Optimization code.")
 
-# 3) Run VRP code, which returns 5 values
-# total_distance, total_co2, total_fuel_cost, avg_delivery_time, fc_counts
-total_distance, total_co2, total_fuel_cost, avg_delivery_time, fc_counts = run_vrp()
+# 3) Read the latest plan published by the background optimizer. Solving runs
+# on the scheduler thread (one per server process, shared by all sessions),
+# so the page only waits on the very first run.
+@st.cache_resource
+def vrp_scheduler():
+    return get_scheduler()
+
+scheduler = vrp_scheduler()
+if st.sidebar.button("Recompute routes"):
+    scheduler.request_recompute()
+    st.sidebar.info("Recompute requested; the new plan appears on the next refresh.")
+
+vrp_entry = scheduler.latest()
+if vrp_entry is None:
+    with st.spinner("Optimizing routes for the first time..."):
+        vrp_entry = scheduler.wait_for_first()
+if vrp_entry is None:
+    st.error(f"Route optimization failed: {scheduler.last_error}")
+    st.stop()
+
+age_s = int(time.time() - vrp_entry["computed_at"])
+st.caption(f"Plan v{vrp_entry['version']} computed {age_s} seconds ago.")
+
+# run_vrp returns a VRPResult with per-driver and per-leg metrics
+result = vrp_entry["result"]
+total_distance = round(result.total_distance_km, 2)
+total_co2 = result.total_co2_kg
+total_fuel_cost = result.total_fuel_cost
+avg_delivery_time = round(result.avg_delivery_time_min, 2)
+fc_counts = result.fc_counts
+baseline = result.baseline
+stops = result.stops
 
 # 4) MAP (center) + LEGEND (right)
 col_center, col_right = st.columns([3, 1])
 with col_center:
-    map_file = "ExpandedDubai_VRP.html"
-    if os.path.exists(map_file):
-        with open(map_file, 'r', encoding='utf-8') as f:
-            map_html = f.read()
+    map_html = vrp_entry["map_html"]
+    if map_html:
         components.html(map_html, height=550)
     else:
         st.error("Map file not found. Please run AdvancedVRP.py to generate the map.")
@@ -50,7 +77,7 @@ with col_right:
         ">
             <h5 style="margin-top: 0; margin-bottom: 8px;">Map Overview</h5>
             <p style="margin-bottom: 6px;">
-                This map shows 2 Warehouses, 4 Fulfillment Centers, and 20 Delivery Points.
+                This map shows {len(stops.warehouse_indices)} Warehouses, {len(stops.fc_indices)} Fulfillment Centers, and {len(stops.drop_indices)} Delivery Points.
             </p>
             <ul style="padding-left: 18px; margin-bottom: 6px;">
                 <li>Routes are optimized using a VRP + TSP approach with priority-based deliveries.</li>
@@ -110,12 +137,12 @@ with col_right:
 st.write("---")
 st.markdown("### Comparison (Before vs. After Optimization)")
 
-# For demonstration, here are some approximate baseline (unoptimized) numbers
-# for 20 deliveries in Dubai. Adjust them to match your actual naive scenario.
-baseline_distance_km = 520
-baseline_avg_time_min = 34
-baseline_co2_kg = 150
-baseline_fuel_cost_aed = 185
+# Naive baseline computed by run_vrp: every drop served as a round trip
+# from its nearest Fulfillment Center.
+baseline_distance_km = baseline.get("distance_km", 0)
+baseline_avg_time_min = baseline.get("avg_time_min", 0)
+baseline_co2_kg = baseline.get("co2_kg", 0)
+baseline_fuel_cost_aed = baseline.get("fuel_cost", 0)
 
 col_baseline, col_optimized = st.columns(2)
 
@@ -139,35 +166,39 @@ with col_optimized:
 
 st.sidebar.subheader("Analytics Overview")
 
-# A) Driver Utilization (Distance) - Example data
+# Per-driver metrics straight from the VRP result
+driver_table = result.driver_table()
+driver_labels = [f"D{d}" for d in driver_table["driver_id"]]
+
+# A) Driver Utilization (Distance)
 driver_data = pd.DataFrame({
-    'driver': ['D1','D2','D3','D4','D5','D6','D7','D8','D9','D10'],
-    'distance': [20, 25, 60, 62, 38, 45, 45, 30, 38, 55],
-    'deliveries': [2,2,2,2,2,2,2,2,2,2],
+    'driver': driver_labels,
+    'distance': [round(d, 2) for d in driver_table["distance_km"]],
+    'deliveries': driver_table["deliveries"],
 })
 driver_bar = alt.Chart(driver_data).mark_bar(size=20).encode(
-    x=alt.X('driver:N', title='Driver', sort=['D1','D2','D3','D4','D5','D6','D7','D8','D9','D10']),
+    x=alt.X('driver:N', title='Driver', sort=driver_labels),
     y=alt.Y('distance:Q', title='Delivery Distance (km)'),
     color=alt.value('#607D8B')
 ).properties(width=240, height=200)
 st.sidebar.subheader("Driver Utilization (Distance)")
 st.sidebar.altair_chart(driver_bar, use_container_width=True)
 
-# B) Driver Delivery Time (Bar Chart) - Example data
+# B) Driver Delivery Time (Bar Chart)
 driver_times_df = pd.DataFrame({
-    'driver': ['D1','D2','D3','D4','D5','D6','D7','D8','D9','D10'],
-    'time': [29, 28, 80, 91, 70, 50, 39, 35, 45, 92]
+    'driver': driver_labels,
+    'time': [round(t, 2) for t in driver_table["time_min"]],
 })
 driver_time_bar = alt.Chart(driver_times_df).mark_bar(size=20).encode(
-    x=alt.X('driver:N', title='Driver', sort=['D1','D2','D3','D4','D5','D6','D7','D8','D9','D10']),
-    y=alt.Y('time:Q', title='Time (min)', axis=alt.Axis(values=[0,10,20,30,40,50,60,70,80,90,100])),
+    x=alt.X('driver:N', title='Driver', sort=driver_labels),
+    y=alt.Y('time:Q', title='Time (min)'),
     color=alt.value('#607D8B')
 ).properties(width=240, height=200)
 st.sidebar.subheader("Driver Delivery Time")
 st.sidebar.altair_chart(driver_time_bar, use_container_width=True)
 
 # C) Fulfillment Center Utilization (Pie Chart)
-fc_map = {2: "FC1", 3: "FC2", 4: "FC3", 5: "FC4"}
+fc_map = {fc_idx: f"FC{k + 1}" for k, fc_idx in enumerate(stops.fc_indices)}
 mapped_data = []
 for fc_idx, count in fc_counts.items():
     if fc_idx in fc_map:
@@ -176,7 +207,7 @@ for fc_idx, count in fc_counts.items():
 fc_df = pd.DataFrame(mapped_data, columns=["Fulfillment Center", "Deliveries"])
 fc_pie = alt.Chart(fc_df).mark_arc(innerRadius=50).encode(
     theta=alt.Theta("Deliveries:Q", stack=True),
-    color=alt.Color("Fulfillment Center:N", sort=["FC1","FC2","FC3","FC4"]),
+    color=alt.Color("Fulfillment Center:N", sort=list(fc_map.values())),
     tooltip=["Fulfillment Center:N", "Deliveries:Q"]
 ).properties(width=250, height=250)
 
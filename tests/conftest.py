@@ -0,0 +1,99 @@
+"""
+Shared fixtures. AdvancedVRP loads its road graph at import time, so the
+OSM download is replaced by a small synthetic grid (stored in a temporary
+graph store) before the module is imported.
+"""
+import os
+import random
+import sys
+import tempfile
+
+import networkx as nx
+import numpy as np
+import osmnx as ox
+import pytest
+
+GRID_N = 12
+LAT0, LON0 = 25.0, 55.0
+
+
+def synthetic_grid(place=None, network_type=None, n=GRID_N, seed=0):
+    """n x n street grid (about 1 km blocks) with random one-way gaps and lengths."""
+    rnd = random.Random(seed)
+    G = nx.MultiDiGraph(crs="epsg:4326")
+    for i in range(n):
+        for j in range(n):
+            G.add_node(i * n + j, x=LON0 + j * 0.01, y=LAT0 + i * 0.009,
+                       **({"highway": "traffic_signals"} if rnd.random() < 0.05 else {}))
+    for i in range(n):
+        for j in range(n):
+            a = i * n + j
+            for di, dj in ((0, 1), (1, 0)):
+                if i + di < n and j + dj < n:
+                    b = (i + di) * n + j + dj
+                    length = 900 + rnd.random() * 300
+                    for u, v in ((a, b), (b, a)):
+                        if rnd.random() < 0.9:
+                            G.add_edge(u, v, length=length, highway="residential",
+                                       maxspeed=str(rnd.choice([40, 60, 80])), oneway=False)
+    return G
+
+
+_scratch = tempfile.mkdtemp(prefix="vrp-tests-")
+os.environ["VRP_GRAPH_STORE"] = os.path.join(_scratch, "graph")
+os.environ["VRP_GEOCODE_CACHE"] = os.path.join(_scratch, "geocode.sqlite")
+os.environ["VRP_RESULT_CACHE"] = os.path.join(_scratch, "results")
+os.environ["VRP_MAP_CACHE"] = os.path.join(_scratch, "maps")
+os.environ.setdefault("VRP_USE_CH", "0")
+ox.graph_from_place = synthetic_grid
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AdvancedVRP  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def vrp():
+    return AdvancedVRP
+
+
+@pytest.fixture(scope="session")
+def snapshot(vrp):
+    return vrp.graph_snapshot
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def offline(vrp, monkeypatch):
+    """No network: TomTom returns no flows and stops without coordinates fail to geocode."""
+    monkeypatch.setattr(vrp, "fetch_tomtom_flows", lambda coords, key: {c: None for c in coords})
+    monkeypatch.setattr(vrp, "geocode_locations", lambda names, geocoder=None: [None] * len(names))
+    return vrp
+
+
+@pytest.fixture
+def make_stops(vrp, snapshot):
+    """
+    StopTable from (name, role, node, demand=1, window=None, priority=0)
+    tuples placed on grid nodes; node None leaves the stop un-geocoded.
+    """
+    def build(rows):
+        cols = {c: [] for c in vrp.STOP_COLUMNS}
+        for name, role, node, *rest in rows:
+            demand, window, priority = (list(rest) + [1, None, 0][len(rest):])[:3]
+            cols["name"].append(name)
+            cols["role"].append(vrp.ROLE_CODES[role])
+            cols["lat"].append(np.nan if node is None else float(snapshot.node_y[node]))
+            cols["lon"].append(np.nan if node is None else float(snapshot.node_x[node]))
+            cols["priority"].append(priority)
+            cols["window_start"].append(np.nan if window is None else window[0])
+            cols["window_end"].append(np.nan if window is None else window[1])
+            cols["demand"].append(demand)
+        return vrp.StopTable(np.array(cols["name"], dtype=object), np.array(cols["role"], dtype=np.int8),
+                             np.array(cols["lat"]), np.array(cols["lon"]), np.array(cols["priority"], dtype=np.int8),
+                             np.array(cols["window_start"]), np.array(cols["window_end"]),
+                             np.array(cols["demand"], dtype=np.int32))
+    return build
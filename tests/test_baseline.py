@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+GRID = 12
+
+
+def test_baseline_times_use_the_leg_model(offline, make_stops):
+    vrp = offline
+    rows = [("FC-A", "fc", 1 * GRID + 1), ("FC-B", "fc", 10 * GRID + 10)]
+    rows += [(f"d{k}", "drop", k * 11 % (GRID * GRID)) for k in range(1, 15)]
+    stops, nodes, engine, _ = vrp.prepare_engine(make_stops(rows), [])
+    legs = vrp.LegCache(engine, nodes)
+
+    km, _, _, avg_min = vrp.calculate_naive_baseline(stops.coords(), nodes, engine, stops=stops, fleet=[])
+
+    expected_km, times = 0.0, []
+    for drop in stops.drop_indices:
+        trips = [(legs.get(fc, drop).length_km + legs.get(drop, fc).length_km, fc) for fc in stops.fc_indices]
+        best_km, fc = min(trips)
+        expected_km += best_km
+        times.append(legs.get(fc, drop).drive_time_min())
+    assert km == pytest.approx(expected_km)
+    assert avg_min == pytest.approx(np.mean(times))
+
+
+def test_baseline_and_routes_share_the_time_model(offline, make_stops):
+    # one drop per driver, served from its nearest FC: the plan is the baseline's out-leg
+    vrp = offline
+    rows = [("FC", "fc", 5 * GRID + 5), ("d0", "drop", 5 * GRID + 9), ("d1", "drop", 2 * GRID + 3)]
+    fleet = [{"id": 1, "capacity": 1, "color": "red"}, {"id": 2, "capacity": 1, "color": "blue"}]
+
+    result = vrp.run_vrp(solver="cluster", render=False, stops=make_stops(rows), fleet=fleet)
+
+    assert result.avg_delivery_time_min == pytest.approx(result.baseline["avg_time_min"], abs=0.01)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+GRID = 12
+
+
+def _node(i, j):
+    return i * GRID + j
+
+
+def test_clusters_respect_capacity_by_demand(vrp, rng):
+    coords = np.column_stack([25.0 + rng.random(40) * 0.1, 55.0 + rng.random(40) * 0.1])
+    demands = rng.integers(1, 4, size=40)
+    caps = [30, 30, 25, 25]
+    assert demands.sum() <= sum(caps)
+
+    clusters = vrp.cluster_deliveries(list(range(40)), coords=coords, capacities=caps, k=4, demands=demands)
+
+    assert sorted(i for c in clusters for i in c) == list(range(40))
+    for cluster, cap in zip(clusters, caps):
+        assert demands[cluster].sum() <= cap
+
+
+def test_clusters_follow_geography_not_index_order(vrp, rng):
+    # even rows near one corner, odd rows near the opposite one
+    west = np.column_stack([25.0 + rng.random(10) * 0.01, 55.0 + rng.random(10) * 0.01])
+    east = west + 0.5
+    coords = np.empty((20, 2))
+    coords[0::2], coords[1::2] = west, east
+
+    clusters = vrp.cluster_deliveries(list(range(20)), coords=coords, capacities=[10, 10], k=2)
+
+    assert sorted(sorted(c) for c in clusters) == [list(range(0, 20, 2)), list(range(1, 20, 2))]
+
+
+def test_cluster_solver_honours_capacity_and_home_fcs(offline, make_stops):
+    vrp = offline
+    rows = [("FC-A", "fc", _node(1, 1)), ("FC-B", "fc", _node(10, 10))]
+    rows += [(f"d{k}", "drop", (k * 29 + 5) % (GRID * GRID), 1 + k % 3) for k in range(24)]
+    stops = make_stops(rows)
+    fc_a, fc_b = stops.fc_indices
+    fleet = [{"id": 1, "capacity": 14, "color": "red", "fc": fc_a},
+             {"id": 2, "capacity": 14, "color": "blue", "fc": fc_b},
+             {"id": 3, "capacity": 14, "color": "green", "fc": fc_a},
+             {"id": 4, "capacity": 14, "color": "black", "fc": fc_b}]
+    stops, nodes, engine, fleet = vrp.prepare_engine(stops, fleet)
+
+    plan = vrp.solve_vrp_clustering(engine, nodes, stops=stops, fleet=fleet)
+
+    served = [x for r in plan for x in r["route"][1:-1]]
+    assert sorted(served) == stops.drop_indices
+    for r in plan:
+        route, driver = r["route"], r["driver"]
+        assert route[0] == route[-1] == driver["fc"]
+        assert stops.demand[route[1:-1]].sum() <= driver["capacity"]
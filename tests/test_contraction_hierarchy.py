@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from scipy.sparse.csgraph import dijkstra
+
+
+@pytest.fixture(scope="module")
+def engine(vrp, snapshot):
+    return vrp.MatrixEngine(snapshot)
+
+
+@pytest.fixture(scope="module")
+def ch(vrp, snapshot):
+    return vrp.ContractionHierarchy.build(snapshot)
+
+
+@pytest.mark.parametrize("weight", ["travel_time", "length"])
+def test_many_to_many_matches_dijkstra(engine, ch, snapshot, rng, weight):
+    sources = rng.choice(snapshot.n_nodes, 20, replace=False)
+    targets = rng.choice(snapshot.n_nodes, 30, replace=False)
+    mat, _ = engine.csr(weight)
+    expected = dijkstra(mat, directed=True, indices=sources)[:, targets]
+
+    got = ch.many_to_many(ch.customize(engine.weights[weight]), sources, targets)
+
+    assert np.array_equal(np.isfinite(got), np.isfinite(expected))
+    finite = np.isfinite(expected)
+    np.testing.assert_allclose(got[finite], expected[finite], rtol=1e-9)
+
+
+def test_shortest_path_edges_form_a_shortest_path(engine, ch, snapshot, rng):
+    metric = ch.customize(engine.weights["length"])
+    lengths = np.asarray(snapshot.edge_length)
+    mat, _ = engine.csr("length")
+    for s, t in rng.choice(snapshot.n_nodes, (15, 2)):
+        expected = dijkstra(mat, directed=True, indices=int(s))[t]
+        edges = ch.shortest_path_edges(metric, int(s), int(t))
+        if not np.isfinite(expected):
+            assert edges is None
+            continue
+        tails = np.asarray(snapshot.edge_tail)[edges]
+        heads = np.asarray(snapshot.edge_head)[edges]
+        if len(edges):
+            assert tails[0] == s and heads[-1] == t
+            assert np.array_equal(tails[1:], heads[:-1])
+        assert lengths[edges].sum() == pytest.approx(expected, rel=1e-9)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+GRID = 12
+
+# (km per litre, price per litre, kg CO2 per km) of each vehicle type
+VEHICLES = {"van": (12.0, 3.0, 0.2), "ev_van": (60.0, 3.0, 0.05), "motorbike": (35.0, 3.0, 0.07)}
+
+
+def test_cost_matrix_matches_hand_computed_values(vrp):
+    time_s = np.array([[0.0, 600.0, 600.0], [120.0, 0.0, np.inf]])
+    length_m = np.array([[0.0, 10_000.0, 10_000.0], [1_500.0, 0.0, 2_000.0]])
+    priority = np.array([0, 1, 3])
+
+    van = vrp.CostModel.for_driver({"id": 1})
+    # 10 km in a van: 10/12 l * 3.0 = 2.5 fuel, 10 * 0.2 = 2 kg CO2 (weight 0.5), 600 s
+    assert van.cost_matrix(time_s, length_m, priority)[0].tolist() == pytest.approx([0.0, 603.5, 613.5])
+    assert van.cost_matrix(time_s, length_m, priority)[1, 0] == pytest.approx(120 + 0.375 + 0.15)
+    assert van.cost_matrix(time_s, length_m)[1, 2] == vrp.COST_UNREACHABLE
+
+    ev = vrp.CostModel.for_driver({"id": 2, "vehicle": "ev_van"}, time_weight=0.0, priority_weight=1.0)
+    # 10 km in an EV van: 10/60 l * 3.0 = 0.5, 10 * 0.05 = 0.5 kg CO2 (weight 0.5)
+    assert ev.cost_matrix(time_s, length_m, priority)[0].tolist() == pytest.approx([0.0, 0.75, 2.75])
+
+
+@pytest.mark.parametrize("vehicle", sorted(VEHICLES))
+def test_vehicle_fuel_and_emissions(vrp, vehicle):
+    efficiency, price, factor = VEHICLES[vehicle]
+    fuel, co2 = vrp.VehicleType.for_driver({"id": 1, "vehicle": vehicle}).fuel_and_emissions(42.0)
+    assert fuel == pytest.approx(42.0 / efficiency * price)
+    assert co2 == pytest.approx(42.0 * factor)
+
+
+def test_route_figures_use_each_drivers_vehicle(offline, make_stops):
+    vrp = offline
+    rows = [("FC", "fc", 5 * GRID + 5)] + [(f"d{k}", "drop", (k * 31 + 3) % (GRID * GRID)) for k in range(9)]
+    fleet = [{"id": k, "capacity": 3, "color": "red", "vehicle": v} for k, v in enumerate(sorted(VEHICLES), 1)]
+
+    result = vrp.run_vrp(solver="cvrptw", time_budget_s=0.5, render=False, stops=make_stops(rows), fleet=fleet)
+
+    assert {r.driver_id for r in result.routes} == {1, 2, 3}
+    for route in result.routes:
+        efficiency, price, factor = VEHICLES[fleet[route.driver_id - 1]["vehicle"]]
+        assert route.distance_km > 0
+        assert route.fuel_cost == pytest.approx(route.distance_km / efficiency * price)
+        assert route.co2_kg == pytest.approx(route.distance_km * factor)
+        for leg in route.legs:
+            assert leg.fuel_cost == pytest.approx(leg.distance_km / efficiency * price)
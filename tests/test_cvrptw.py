@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+GRID = 12
+
+
+@pytest.fixture
+def small_day(make_stops):
+    rows = [("FC-A", "fc", 1 * GRID + 1), ("FC-B", "fc", 10 * GRID + 10)]
+    rows += [(f"d{k}", "drop", (k * 13 + 7) % (GRID * GRID)) for k in range(12)]
+    return make_stops(rows)
+
+
+def test_benchmark_uses_the_run_fleet(offline, small_day, monkeypatch):
+    vrp = offline
+    fleet = [{"id": 41, "capacity": 8, "color": "red"}, {"id": 42, "capacity": 8, "color": "blue"}]
+    seen = []
+    build = vrp._build_cvrptw_model
+    monkeypatch.setattr(vrp, "_build_cvrptw_model", lambda *a, **kw: seen.append(a[2]) or build(*a, **kw))
+
+    vrp.run_vrp(solver="cvrptw", time_budget_s=0.2, benchmark=True, render=False, stops=small_day, fleet=fleet)
+
+    assert seen and all([d["id"] for d in f] == [41, 42] for f in seen)
+
+
+@pytest.fixture
+def windowed_day(make_stops):
+    """Two FCs and 16 drops; every other drop has a one-hour window staggered over the morning."""
+    rows = [("FC-A", "fc", 1 * GRID + 1), ("FC-B", "fc", 10 * GRID + 10)]
+    for k in range(16):
+        start = 8 * 3600 + (k // 2) * 1800
+        window = (start, start + 3600) if k % 2 else None
+        rows.append((f"d{k}", "drop", (k * 37 + 11) % (GRID * GRID), 1 + k % 2, window))
+    return make_stops(rows)
+
+
+def _solve(vrp, stops, fleet):
+    stops, nodes, engine, fleet = vrp.prepare_engine(stops, fleet)
+    time_matrix, length_matrix = engine.matrices(nodes, depart_s=vrp.SHIFT_START_S)
+    routes, unserved = vrp._solve_cvrptw_routes(
+        time_matrix, length_matrix, stops, fleet, stops.fc_indices, stops.drop_indices,
+        vrp.SHIFT_START_S, time_budget_s=1, service_time_s=vrp.SERVICE_TIME_S)
+    return stops, time_matrix, routes, unserved
+
+
+def test_cvrptw_plan_keeps_windows_capacity_and_travel_times(offline, windowed_day):
+    vrp = offline
+    fleet = [{"id": k, "capacity": 8, "color": "red"} for k in range(1, 5)]
+    stops, time_matrix, routes, unserved = _solve(vrp, windowed_day, fleet)
+
+    assert unserved == 0
+    assert sorted(x for r in routes for x in r["route"][1:-1]) == stops.drop_indices
+    for r in routes:
+        route, arrivals = r["route"], r["arrival_s"]
+        assert stops.demand[route[1:-1]].sum() <= r["driver"]["capacity"]
+        assert arrivals[0] >= vrp.SHIFT_START_S
+        for k, loc in enumerate(route[1:-1], start=1):
+            if np.isfinite(stops.window_start[loc]):
+                assert stops.window_start[loc] <= arrivals[k] <= stops.window_end[loc]
+        for k in range(len(route) - 1):
+            service = vrp.SERVICE_TIME_S if k > 0 else 0
+            assert arrivals[k + 1] >= arrivals[k] + service + np.rint(time_matrix[route[k], route[k + 1]])
+
+
+def test_cvrptw_drops_a_stop_whose_window_cannot_be_met(offline, make_stops):
+    vrp = offline
+    stops = make_stops([("FC", "fc", 1 * GRID + 1), ("ok", "drop", 3 * GRID + 3),
+                        ("too early", "drop", 11 * GRID + 11, 1, (6 * 3600, 7 * 3600))])
+    stops, _, routes, unserved = _solve(vrp, stops, [{"id": 1, "capacity": 5, "color": "red"}])
+
+    assert unserved == 1
+    assert [stops.name[x] for r in routes for x in r["route"][1:-1]] == ["ok"]
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+GRID = 12
+
+
+def _node(i, j):
+    return i * GRID + j
+
+
+@pytest.fixture
+def two_fc_stops(make_stops):
+    # FC-A in the south-west corner, FC-B in the north-east one, drops around both
+    rows = [("lost drop", "drop", None), ("FC-A", "fc", _node(1, 1)), ("FC-B", "fc", _node(10, 10))]
+    rows += [(f"a{k}", "drop", _node(k % 3, 2 + k // 3)) for k in range(6)]
+    rows += [(f"b{k}", "drop", _node(9 + k % 3, 7 + k // 3)) for k in range(6)]
+    return make_stops(rows)
+
+
+@pytest.mark.parametrize("solver", ["cvrptw", "cluster"])
+def test_home_fc_survives_dropped_stops(offline, two_fc_stops, solver):
+    vrp = offline
+    fc_a, fc_b = two_fc_stops.fc_indices
+    fleet = [{"id": 1, "capacity": 10, "color": "red", "fc": fc_b},
+             {"id": 2, "capacity": 10, "color": "blue", "fc": fc_a}]
+
+    stops, _, _, remapped = vrp.prepare_engine(two_fc_stops, fleet)
+
+    assert stops.n == two_fc_stops.n - 1
+    assert [stops.name[d["fc"]] for d in remapped] == ["FC-B", "FC-A"]
+    assert fleet[0]["fc"] == fc_b       # the caller's fleet is left alone
+
+    result = vrp.run_vrp(solver=solver, time_budget_s=1, render=False, stops=two_fc_stops, fleet=fleet)
+    homes = {r.driver_id: result.stops.name[r.fc] for r in result.routes}
+    assert homes == {1: "FC-B", 2: "FC-A"}
+
+
+def test_remap_fleet_drops_homes_that_were_not_kept(vrp):
+    fleet = [{"id": 1, "capacity": 5, "fc": 2}, {"id": 2, "capacity": 5, "fc": 4}, {"id": 3, "capacity": 5}]
+    remapped = vrp.remap_fleet(fleet, np.array([0, 2, 3]))
+    assert remapped[0]["fc"] == 1
+    assert "fc" not in remapped[1] and "fc" not in remapped[2]
+
+
+def test_stop_table_without_fcs_is_rejected(offline, make_stops, tmp_path):
+    vrp = offline
+    stops = make_stops([("d0", "drop", _node(3, 3)), ("d1", "drop", _node(4, 4))])
+    with pytest.raises(ValueError, match="no FC rows"):
+        vrp.prepare_engine(stops, [{"id": 1, "capacity": 5, "color": "red"}])
+    fleet_csv = tmp_path / "fleet.csv"
+    fleet_csv.write_text("id,capacity\n1,5\n")
+    with pytest.raises(ValueError, match="no FC rows"):
+        vrp.load_fleet(str(fleet_csv), stops)
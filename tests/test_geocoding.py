@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+
+class CountingGeocoder:
+    """geopy-style stub that records every address it is asked for."""
+
+    def __init__(self, coords, fail=()):
+        self.coords = coords
+        self.fail = set(fail)
+        self.calls = []
+
+    def geocode(self, address, timeout=None):
+        self.calls.append(address)
+        if address in self.fail:
+            raise RuntimeError("service unavailable")
+        c = self.coords.get(address)
+        return None if c is None else type("Location", (), {"latitude": c[0], "longitude": c[1]})()
+
+
+@pytest.fixture
+def batch(vrp):
+    def build(geocoder, fallbacks=None):
+        return vrp.BatchGeocoder(geocoder, cache=vrp.GeocodeCache(":memory:"), fallbacks=fallbacks)
+    return build
+
+
+def test_geocode_locations_accepts_a_plain_geocoder_without_rate_limit(vrp):
+    names = [f"Stop {k}, Dubai" for k in range(26)]
+    stub = vrp.StaticGeocoder({name: (25.0 + k / 100, 55.0) for k, name in enumerate(names)})
+
+    start = time.perf_counter()
+    coords = vrp.geocode_locations(names, geocoder=stub)
+
+    assert time.perf_counter() - start < 2.0
+    assert coords == [(25.0 + k / 100, 55.0) for k in range(26)]
+
+
+def test_only_nominatim_is_rate_limited(vrp, batch):
+    assert batch(CountingGeocoder({})).limiter is None
+    assert vrp.BatchGeocoder(cache=vrp.GeocodeCache(":memory:")).limiter is not None
+    assert vrp.BatchGeocoder(CountingGeocoder({}), cache=vrp.GeocodeCache(":memory:"), rate_per_s=5).limiter
+
+
+def test_second_batch_is_served_from_the_cache(batch):
+    stub = CountingGeocoder({"Marina Walk, Dubai": (25.08, 55.14)})
+    geocoder = batch(stub)
+
+    first = geocoder.geocode(["Marina Walk, Dubai", "Nowhere"])
+    second = geocoder.geocode(["Marina Walk, Dubai", "Nowhere"])
+
+    assert first == second == [(25.08, 55.14), None]
+    assert sorted(stub.calls) == ["Marina Walk, Dubai", "Nowhere"]    # misses are cached too
+
+
+def test_addresses_are_normalised_before_lookup(vrp, batch):
+    stub = CountingGeocoder({"  Marina  Walk ,Dubai ": (25.08, 55.14)})
+
+    coords = batch(stub).geocode(["  Marina  Walk ,Dubai ", "marina walk, DUBAI", "Marina Walk,Dubai"])
+
+    assert coords == [(25.08, 55.14)] * 3
+    assert len(stub.calls) == 1
+    assert vrp.normalize_address("  Marina  Walk ,Dubai ") == "marina walk,dubai"
+
+
+def test_fallbacks_fill_misses_and_errors(batch):
+    stub = CountingGeocoder({"Known": (25.1, 55.1)}, fail={"Broken"})
+    fallbacks = {"unknown": (25.2, 55.2), "BROKEN": (25.3, 55.3)}
+
+    coords = batch(stub, fallbacks).geocode(["Known", "Unknown", "Broken", "Lost"])
+
+    assert coords == [(25.1, 55.1), (25.2, 55.2), (25.3, 55.3), None]
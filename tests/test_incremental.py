@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+GRID = 12
+
+
+def _node(i, j):
+    return i * GRID + j
+
+
+@pytest.fixture
+def day(make_stops):
+    rows = [("FC-A", "fc", _node(1, 1)), ("FC-B", "fc", _node(10, 10))]
+    rows += [(f"a{k}", "drop", _node(k % 3, 2 + k // 3)) for k in range(5)]
+    rows += [(f"b{k}", "drop", _node(9 + k % 3, 7 + k // 3)) for k in range(5)]
+    return make_stops(rows)
+
+
+@pytest.fixture
+def fleet():
+    return [{"id": 1, "capacity": 6, "color": "red"}, {"id": 2, "capacity": 6, "color": "blue"},
+            {"id": 3, "capacity": 6, "color": "green"}]
+
+
+def _served(plan):
+    return [x for r in plan.route_assignments for x in r["route"][1:-1]]
+
+
+def _loads_fit(plan):
+    return all(int(plan.stops.demand[r["route"][1:-1]].sum()) <= r["driver"]["capacity"]
+               for r in plan.route_assignments)
+
+
+def test_add_and_remove_orders_repair_the_plan(offline, day, fleet, snapshot):
+    vrp = offline
+    plan = vrp.start_incremental_plan(solver="cvrptw", time_budget_s=0.5, stops=day, fleet=fleet)
+    before = sorted(_served(plan))
+    assert before == day.drop_indices
+
+    node = _node(10, 8)
+    row = plan.add_order("late", float(snapshot.node_y[node]), float(snapshot.node_x[node]), demand=2)
+    assert plan.node_list[row] == node
+    assert sorted(_served(plan)) == sorted(before + [row])
+    assert _loads_fit(plan)
+    for r in plan.route_assignments:
+        assert r["route"][0] == r["route"][-1] in plan.stops.fc_indices
+
+    plan.remove(row)
+    plan.remove(before[0])
+    assert sorted(_served(plan)) == before[1:]
+    with pytest.raises(KeyError):
+        plan.remove(row)
+    assert np.isfinite(plan.total_cost())
+
+
+def test_removing_the_last_drop_frees_the_driver(offline, day, fleet):
+    vrp = offline
+    plan = vrp.start_incremental_plan(solver="cvrptw", time_budget_s=0.5, stops=day, fleet=fleet)
+    for x in list(_served(plan)):
+        plan.remove(x)
+    assert plan.route_assignments == []
+
+    did = plan.insert(day.drop_indices[0])     # an idle driver starts a new route
+    (route,) = plan.route_assignments
+    assert route["driver"]["id"] == did
+    assert route["route"][1:-1] == [day.drop_indices[0]]
+
+
+def test_insert_without_any_driver_with_room_is_an_error(offline, day):
+    vrp = offline
+    stops, nodes, engine, fleet = vrp.prepare_engine(day, [{"id": 1, "capacity": 1, "color": "red"}])
+    plan = vrp.IncrementalPlanner(engine, nodes, [], stops=stops, fleet=fleet, depart_s=vrp.SHIFT_START_S)
+    heavy = stops.drop_indices[0]
+    stops.demand[heavy] = 3
+    with pytest.raises(ValueError, match="No driver can take"):
+        plan.insert(heavy)
+    assert plan.route_assignments == []
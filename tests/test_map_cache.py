@@ -0,0 +1,45 @@
+import os
+import time
+
+
+def _touch(path, age_s):
+    path.write_text("<html></html>")
+    t = time.time() - age_s
+    os.utime(path, (t, t))
+
+
+def test_prune_keeps_the_most_recent_maps(vrp, tmp_path):
+    for k in range(5):
+        _touch(tmp_path / f"map{k}.html", age_s=100 * k)
+    _touch(tmp_path / "notes.txt", age_s=10 ** 9)
+
+    assert vrp.prune_map_cache(str(tmp_path), max_files=2, max_age_s=3600) == 3
+    assert sorted(os.listdir(tmp_path)) == ["map0.html", "map1.html", "notes.txt"]
+
+
+def test_prune_drops_old_maps_and_leftover_temporaries(vrp, tmp_path):
+    _touch(tmp_path / "fresh.html", age_s=10)
+    _touch(tmp_path / ".fresh.123.html", age_s=10)      # another process is still writing it
+    _touch(tmp_path / "old.html", age_s=7200)
+    _touch(tmp_path / ".old.123.html", age_s=7200)
+
+    assert vrp.prune_map_cache(str(tmp_path), max_files=10, max_age_s=3600) == 2
+    assert sorted(os.listdir(tmp_path)) == [".fresh.123.html", "fresh.html"]
+
+
+def test_render_prunes_and_a_hit_refreshes_the_entry(offline, make_stops, monkeypatch, tmp_path):
+    vrp = offline
+    monkeypatch.setattr(vrp, "MAP_CACHE_MAX_FILES", 1)
+    stops = make_stops([("FC", "fc", 13), ("d0", "drop", 40), ("d1", "drop", 90)])
+    fleet = [{"id": 1, "capacity": 5, "color": "red"}]
+    result = vrp.run_vrp(solver="cvrptw", time_budget_s=0.2, render=False, stops=stops, fleet=fleet)
+
+    cache_dir = tmp_path / "maps"
+    cache_dir.mkdir()
+    _touch(cache_dir / "older.html", age_s=60)
+    first = vrp.render_vrp_map(result, out_path=None, cache_dir=str(cache_dir))
+    assert os.listdir(cache_dir) == [os.path.basename(first)]
+
+    os.utime(first, (0, 0))
+    assert vrp.render_vrp_map(result, out_path=None, cache_dir=str(cache_dir)) == first
+    assert os.path.getmtime(first) > time.time() - 60
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+
+def _overlay_engine(vrp, snapshot, travel_time):
+    return vrp.MatrixEngine(snapshot, overlay=vrp.TravelTimeOverlay(snapshot.key, travel_time, source="test"))
+
+
+@pytest.fixture
+def before(vrp, snapshot, rng):
+    engine = vrp.MatrixEngine(snapshot)
+    sources = rng.choice(snapshot.n_nodes, 40, replace=False)
+    targets = rng.choice(snapshot.n_nodes, 40, replace=False)
+    return engine, sources, targets, engine.distances(sources, targets)
+
+
+@pytest.mark.parametrize("n_slower, n_faster", [(3, 0), (0, 3), (3, 3)])
+def test_update_matrix_matches_full_recompute(vrp, snapshot, rng, before, n_slower, n_faster):
+    engine, sources, targets, old = before
+    old_w = np.asarray(engine.weights["travel_time"], dtype=np.float64)
+    new_w = old_w.copy()
+    edges = rng.choice(len(old_w), n_slower + n_faster, replace=False)
+    new_w[edges[:n_slower]] *= 4.0
+    new_w[edges[n_slower:]] *= 0.2
+    after = _overlay_engine(vrp, snapshot, new_w)
+
+    updated, n_resolved = after.update_matrix(old, sources, targets, old_w)
+
+    assert n_resolved < old.size    # patched, not recomputed
+    expected = after._distances(sources, targets, "travel_time")
+    assert np.array_equal(np.isfinite(updated), np.isfinite(expected))
+    finite = np.isfinite(expected)
+    np.testing.assert_allclose(updated[finite], expected[finite], rtol=1e-6)
+
+
+def test_update_matrix_falls_back_to_full_recompute(vrp, snapshot, before):
+    engine, sources, targets, old = before
+    old_w = np.asarray(engine.weights["travel_time"], dtype=np.float64)
+    new_w = old_w * np.where(np.arange(len(old_w)) % 2, 1.5, 0.7)
+    after = _overlay_engine(vrp, snapshot, new_w)
+
+    updated, n_resolved = after.update_matrix(old, sources, targets, old_w)
+
+    assert n_resolved == old.size
+    np.testing.assert_allclose(updated, after._distances(sources, targets, "travel_time"), rtol=1e-9)
+
+
+def test_update_matrix_without_changes_is_a_copy(vrp, before):
+    engine, sources, targets, old = before
+    updated, n_resolved = engine.update_matrix(old, sources, targets, engine.weights["travel_time"])
+    assert n_resolved == 0
+    assert updated is not old
+    np.testing.assert_array_equal(updated, old)
+
+
+def test_update_matrix_repairs_rows_after_a_closure_reopens(vrp, snapshot, before):
+    engine, sources, targets, _ = before
+    free = np.asarray(engine.weights["travel_time"], dtype=np.float64)
+    closed_w = free.copy()
+    source = int(sources[0])
+    closed_w[np.flatnonzero(np.asarray(snapshot.edge_tail) == source)] = np.inf    # roadClosure on every exit
+    closed = _overlay_engine(vrp, snapshot, closed_w)
+    old = closed.distances(sources, targets)
+    assert np.isfinite(old[0]).sum() == (targets == source).sum()    # at most the source itself
+
+    reopened = _overlay_engine(vrp, snapshot, free)
+    updated, n_resolved = reopened.update_matrix(old, sources, targets, closed_w)
+
+    assert n_resolved < old.size
+    expected = reopened._distances(sources, targets, "travel_time")
+    assert np.isfinite(updated[0]).sum() == np.isfinite(expected[0]).sum() > np.isfinite(old[0]).sum()
+    np.testing.assert_allclose(updated, expected, rtol=1e-6)
+
+    # and closing it again is patched back to unreachable
+    reclosed, _ = closed.update_matrix(expected, sources, targets, free)
+    np.testing.assert_allclose(reclosed, old, rtol=1e-6)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+
+def _horizontal_edge(snapshot):
+    """An edge in the middle of the grid running east (tail j, head j + 1)."""
+    for e in range(snapshot.n_edges):
+        t, h = int(snapshot.edge_tail[e]), int(snapshot.edge_head[e])
+        if h == t + 1 and 40 <= t < 100:
+            return t, h
+    raise AssertionError("grid has no eastbound edge")
+
+
+@pytest.fixture
+def locator(vrp, snapshot):
+    return vrp.NodeLocator.build(snapshot)
+
+
+def test_edge_snap_reports_the_distance_to_the_chosen_node(vrp, snapshot, locator):
+    t, h = _horizontal_edge(snapshot)
+    # A quarter of the way along the edge and ~22 m north of it: nearer the tail.
+    lon = snapshot.node_x[t] + 0.25 * (snapshot.node_x[h] - snapshot.node_x[t])
+    lat = snapshot.node_y[t] + 0.0002
+
+    nodes, dist = locator.snap([lat, np.nan], [lon, 55.0], edges=True)
+
+    x, y = vrp.project_lonlat(lon, lat, locator.lat0)
+    tx, ty = vrp.project_lonlat(snapshot.node_x[t], snapshot.node_y[t], locator.lat0)
+    assert nodes.tolist() == [t, -1]
+    assert dist[0] == pytest.approx(np.hypot(x - tx, y - ty))
+    assert dist[0] > 200                      # not the ~22 m to the edge itself
+    assert np.isinf(dist[1])
+
+
+def test_edge_and_node_snapping_agree_near_a_node(snapshot, locator):
+    t, _ = _horizontal_edge(snapshot)
+    lat, lon = snapshot.node_y[t] + 0.0001, snapshot.node_x[t] + 0.0001
+
+    by_edge = locator.snap(lat, lon, edges=True)
+    by_node = locator.snap(lat, lon)
+
+    assert by_edge[0].tolist() == by_node[0].tolist() == [t]
+    assert by_edge[1][0] == pytest.approx(by_node[1][0])
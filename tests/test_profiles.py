@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+HOUR = 3600
+
+
+def _local(vrp, seconds_of_day):
+    """A Unix timestamp at the given Dubai time of day."""
+    return 86400 * 100 + seconds_of_day - vrp.DUBAI_UTC_OFFSET_S
+
+
+def _scaled(vrp, snapshot, factor, local_s):
+    tt = np.asarray(snapshot.edge_travel_time, dtype=np.float32) * factor
+    return vrp.TravelTimeOverlay(snapshot.key, tt, timestamp=_local(vrp, local_s), source="tomtom",
+                                 n_updated=snapshot.n_edges)
+
+
+@pytest.fixture(scope="module")
+def profiles(vrp, snapshot):
+    # rush hour at 08:30 (twice free flow), light traffic at 13:00 (1.1x)
+    overlays = [_scaled(vrp, snapshot, 2.0, 8.5 * HOUR), _scaled(vrp, snapshot, 1.1, 13 * HOUR)]
+    return vrp.TravelTimeProfiles.from_overlays(snapshot, overlays)
+
+
+@pytest.fixture
+def nodes(rng, snapshot):
+    return rng.choice(snapshot.n_nodes, 15, replace=False)
+
+
+def test_profiles_follow_the_observed_buckets(profiles):
+    edges = np.arange(10)
+    np.testing.assert_allclose(profiles.multipliers(8.5 * HOUR, edges), 2.0, rtol=1e-6)
+    np.testing.assert_allclose(profiles.multipliers(13 * HOUR, edges), 1.1, rtol=1e-6)
+    # between the two observations the curve is interpolated
+    assert 1.1 < profiles.multipliers(10 * HOUR, edges)[0] < 2.0
+
+
+def test_legs_are_priced_at_their_departure_bucket(vrp, snapshot, profiles, nodes):
+    engine = vrp.MatrixEngine(snapshot, profiles=profiles)
+    free = engine.distances(nodes, nodes)
+
+    rush = engine.distances(nodes, nodes, depart_s=8.5 * HOUR)
+    midday = engine.distances(nodes, nodes, depart_s=13 * HOUR)
+
+    off = ~np.eye(len(nodes), dtype=bool) & np.isfinite(free)
+    np.testing.assert_allclose(rush[off], 2.0 * free[off], rtol=1e-5)
+    np.testing.assert_allclose(midday[off], 1.1 * free[off], rtol=1e-5)
+    assert engine.at_departure(8.5 * HOUR) is engine.at_departure(8.5 * HOUR + 600)    # same bucket, one engine
+
+
+def test_live_overlay_is_used_for_its_own_bucket_only(vrp, snapshot, profiles, nodes):
+    live = _scaled(vrp, snapshot, 1.5, 13 * HOUR + 300)
+    engine = vrp.MatrixEngine(snapshot, overlay=live, profiles=profiles)
+    free = vrp.MatrixEngine(snapshot).distances(nodes, nodes)
+    off = ~np.eye(len(nodes), dtype=bool) & np.isfinite(free)
+
+    assert engine.is_live(13 * HOUR) and engine.is_live(13 * HOUR + 899)
+    assert not engine.is_live(13 * HOUR + 900) and not engine.is_live(8.5 * HOUR)
+    assert engine.at_departure(13 * HOUR + 600) is engine
+    np.testing.assert_allclose(engine.distances(nodes, nodes, depart_s=13 * HOUR)[off], 1.5 * free[off], rtol=1e-5)
+    np.testing.assert_allclose(engine.distances(nodes, nodes, depart_s=8.5 * HOUR)[off], 2.0 * free[off], rtol=1e-5)
+
+
+def test_empty_overlay_is_never_live(vrp, snapshot, profiles):
+    empty = vrp.TravelTimeOverlay(snapshot.key, snapshot.edge_travel_time, timestamp=_local(vrp, 13 * HOUR))
+    engine = vrp.MatrixEngine(snapshot, overlay=empty, profiles=profiles)
+    assert not engine.is_live(13 * HOUR)
+    assert vrp.record_overlay(empty, snapshot) is None
+
+
+def test_departure_rows_price_each_row_at_its_own_time(vrp, snapshot, profiles, nodes):
+    engine = vrp.MatrixEngine(snapshot, profiles=profiles)
+    depart = np.where(np.arange(len(nodes)) % 2, 8.5 * HOUR, 13 * HOUR)
+
+    rows = engine.departure_rows(nodes, nodes, depart)
+
+    np.testing.assert_allclose(rows[1::2], engine.distances(nodes[1::2], nodes, depart_s=8.5 * HOUR))
+    np.testing.assert_allclose(rows[::2], engine.distances(nodes[::2], nodes, depart_s=13 * HOUR))
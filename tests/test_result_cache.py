@@ -0,0 +1,39 @@
+import pytest
+
+GRID = 12
+
+
+@pytest.fixture
+def day(offline, make_stops, monkeypatch):
+    vrp = offline
+    rows = [("FC", "fc", 5 * GRID + 5)] + [(f"d{k}", "drop", k * 7 % (GRID * GRID)) for k in range(1, 9)]
+    monkeypatch.setattr(vrp, "stop_table", make_stops(rows))
+    monkeypatch.setattr(vrp, "drivers", [{"id": 1, "capacity": 10, "color": "red"}])
+    calls = []
+    run_vrp = vrp.run_vrp
+    monkeypatch.setattr(vrp, "run_vrp", lambda **kw: calls.append(kw) or run_vrp(**kw))
+    return vrp, calls
+
+
+def test_offline_runs_hit_the_cache(day, tmp_path):
+    vrp, calls = day
+    cache = vrp.ResultCache(path=str(tmp_path))
+
+    entries = [vrp.cached_run_vrp(cache=cache, solver="cluster") for _ in range(3)]
+
+    assert len(calls) == 1
+    assert entries[0]["traffic_id"] == f"{vrp.graph_snapshot.key}-free_flow"
+    assert entries[0]["result"].traffic_id == entries[0]["traffic_id"]
+    assert all(e["computed_at"] == entries[0]["computed_at"] for e in entries)
+
+
+def test_forced_recompute_replaces_the_offline_entry(day, tmp_path):
+    vrp, calls = day
+    cache = vrp.ResultCache(path=str(tmp_path))
+
+    first = vrp.cached_run_vrp(cache=cache, solver="cluster")
+    forced = vrp.cached_run_vrp(cache=cache, solver="cluster", force=True)
+
+    assert len(calls) == 2
+    assert forced["computed_at"] > first["computed_at"]
+    assert vrp.cached_run_vrp(cache=cache, solver="cluster")["computed_at"] == forced["computed_at"]
@@ -0,0 +1,121 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+
+class FlowHandler(BaseHTTPRequestHandler):
+    """flowSegmentData mock: 429 (Retry-After: 0) for the first `throttle` requests of a point."""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        point = query["point"][0]
+        server = self.server
+        with server.lock:
+            server.requests.append(point)
+            throttled = server.throttle.get(point, 0)
+            if throttled:
+                server.throttle[point] = throttled - 1
+        if throttled:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+        lat, lon = map(float, point.split(","))
+        body = json.dumps({"flowSegmentData": {
+            "currentSpeed": 30, "freeFlowSpeed": 60, "confidence": 0.9,
+            "coordinates": {"coordinate": [{"latitude": lat, "longitude": lon},
+                                           {"latitude": lat + 0.001, "longitude": lon}]},
+        }}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FlowHandler)
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.throttle = {}
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def fetcher(vrp, server):
+    def build(**kwargs):
+        url = f"http://127.0.0.1:{server.server_address[1]}/flowSegmentData"
+        return vrp.TomTomFlowFetcher("test-key", base_url=url, backoff_s=0.0, **kwargs)
+    return build
+
+
+def test_points_in_one_tile_share_a_request(fetcher, server):
+    a, b = (25.2000, 55.3000), (25.2001, 55.3001)     # same z18 tile
+    c = (25.2500, 55.3500)
+
+    flows = fetcher().fetch([a, b, c])
+
+    assert len(server.requests) == 2
+    assert flows[a] is flows[b]
+    assert flows[c]["current_speed"] == 30 and flows[c]["free_flow_speed"] == 60
+    assert flows[c]["coordinates"][0] == c
+
+
+def test_tiles_are_cached_until_the_ttl_expires(vrp, fetcher, server, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(vrp.time, "time", lambda: clock[0])
+    f = fetcher(ttl_s=60)
+    points = [(25.20, 55.30), (25.25, 55.35)]
+
+    f.fetch(points)
+    f.fetch(points)
+    assert len(server.requests) == 2
+    clock[0] += 61
+    f.fetch(points)
+
+    assert len(server.requests) == 4
+    assert f.metrics()["hit_rate"] == pytest.approx(2 / 6)
+
+
+def test_throttled_requests_are_retried(fetcher, server):
+    point = (25.20, 55.30)
+    server.throttle["25.2,55.3"] = 2
+    f = fetcher(max_retries=4)
+
+    flow = f.fetch([point])[point]
+
+    assert flow is not None
+    assert len(server.requests) == 3
+    assert f.stats["retries"] == 2 and f.stats["errors"] == 0
+
+
+def test_giving_up_after_max_retries_is_counted(fetcher, server):
+    point = (25.20, 55.30)
+    server.throttle["25.2,55.3"] = 10
+    f = fetcher(max_retries=2)
+
+    assert f.fetch([point])[point] is None
+    m = f.metrics()
+    assert m["requests"] == 3 and m["errors"] == 1
+
+
+def test_metrics_report_latencies(fetcher, server):
+    f = fetcher()
+    f.fetch([(25.20 + k * 0.01, 55.30) for k in range(5)])
+
+    m = f.metrics()
+
+    assert m["points"] == 5 and m["requests"] == 5 and m["hit_rate"] == 0.0
+    assert 0.0 < m["mean_latency_s"] < 5.0
+    assert m["p95_latency_s"] >= min(f.stats["latencies_s"])
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+
+def _assert_closed_tour(tour, n, start):
+    assert tour[0] == tour[-1] == start
+    assert sorted(tour[:-1]) == list(range(n))
+
+
+@pytest.mark.parametrize("start", [0, 7])
+def test_solve_tsp_returns_closed_tour(vrp, rng, start):
+    pts = rng.random((40, 2))
+    cost = np.hypot(*(pts[:, None, :] - pts[None, :, :]).transpose(2, 0, 1))
+    cost *= 1 + 0.3 * rng.random(cost.shape)    # asymmetric
+
+    tour = vrp.solve_tsp(cost, start=start)
+
+    _assert_closed_tour(tour, len(cost), start)
+    nn = vrp._nearest_neighbour_tour(cost.tolist(), start) + [start]
+    length = lambda t: cost[t[:-1], t[1:]].sum()
+    assert length(tour) <= length(nn) + 1e-9
+
+
+def test_solve_tsp_tolerates_unreachable_arcs(vrp, rng):
+    cost = rng.random((12, 12)) * 100
+    cost[3, :] = np.inf
+    cost[3, 5] = 1.0
+
+    tour = vrp.solve_tsp(cost)
+
+    _assert_closed_tour(tour, len(cost), 0)
+    assert tour[tour.index(3) + 1] == 5
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3])
+def test_solve_tsp_small_inputs(vrp, n):
+    tour = vrp.solve_tsp(np.ones((n, n)) - np.eye(n))
+    if n == 0:
+        assert tour == []
+    elif n == 1:
+        assert tour == [0]
+    else:
+        _assert_closed_tour(tour, n, 0)